@@ -1,45 +1,127 @@
 import boto3
+import hashlib
+import io
 import logging
 import os
+import posixpath
 import zipfile
-import tempfile
 import json
+import threading
+import time
+import uuid
+import weakref
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from botocore.config import Config
+from botocore.exceptions import ClientError
 
 logger = logging.getLogger(__name__)
 STACK_PREFIX = "rvm-provisioned"
+# Applied to every stack RVM deploys to mark it as managed by RVM
+MANAGED_TAG = {"Key": "rvm-managed", "Value": "true"}
+# Records the hash of the template a stack was last deployed with
+TEMPLATE_HASH_TAG = "rvm-template-sha256"
+# Statuses of a stack that was last deployed successfully
+DEPLOYED_STATUSES = frozenset(("CREATE_COMPLETE", "UPDATE_COMPLETE"))
 REGION = os.environ["AWS_REGION"]
+MAX_WORKERS = 10
+MAX_DEPLOY_WORKERS = 20
+# Reuse assumed-role credentials only while they outlive the Lambda timeout
+SESSION_REUSE_MARGIN = timedelta(minutes=15)
+# Seconds kept back from the Lambda's remaining time to report results
+DEADLINE_MARGIN = 30
+
+# Adaptive retries rate limit on the client side when throttled, and the larger
+# pool keeps the deployment threads from queueing for connections
+CLIENT_CONFIG = Config(
+    retries={"mode": "adaptive", "max_attempts": 10},
+    max_pool_connections=50,
+    tcp_keepalive=True,
+)
+
+# Creating clients is expensive and not thread safe, but clients themselves can
+# be shared between threads. Default session clients survive warm invocations;
+# clients for assumed-role sessions go away once their session is replaced.
+_clients: dict[str, object] = {}
+_session_clients: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+_clients_lock = threading.Lock()
+
+# Assumed-role sessions keyed by role ARN, kept across warm invocations
+_assumed_sessions: dict[str, tuple[boto3.Session, datetime]] = {}
+
+
+def _client(service_name: str):
+    """Get a client for the Lambda's own credentials, creating it on first use."""
+    with _clients_lock:
+        if service_name not in _clients:
+            _clients[service_name] = boto3.client(service_name, config=CLIENT_CONFIG)
+        return _clients[service_name]
+
+
+def _session_client(session: boto3.Session, service_name: str):
+    """Get a client for an assumed-role session, creating it on first use."""
+    with _clients_lock:
+        clients = _session_clients.setdefault(session, {})
+        if service_name not in clients:
+            clients[service_name] = session.client(
+                service_name, region_name=REGION, config=CLIENT_CONFIG
+            )
+        return clients[service_name]
+
+
+def _timeout_before(deadline: float | None, timeout: float) -> float:
+    """Shorten a wait's timeout so it ends by the monotonic deadline, if any."""
+    if deadline is None:
+        return timeout
+    return max(0, min(timeout, deadline - time.monotonic()))
+
+
+def _download_and_extract_zip(
+    bucket: str, key: str
+) -> tuple[dict[str, object], dict[str, str]]:
+    """Download zip file from S3 and extract the files RVM needs into memory.
+
+    Returns the parsed manifest and the contents of the templates it references,
+    keyed by their normalised path in the archive. Nothing is written to /tmp,
+    which would otherwise fill up across warm invocations.
+    """
+    s3_client = _client("s3")
+
+    logger.info("Downloading %s/%s", bucket, key)
+    response = s3_client.get_object(Bucket=bucket, Key=key)
+    data = response["Body"].read()
+
+    # Extract only the manifest and the templates it references
+    logger.info("Extracting zip file")
+    templates = {}
+    with zipfile.ZipFile(io.BytesIO(data), "r") as zip_ref:
+        # Normalise so that e.g. "./templates/a.yaml" matches "templates/a.yaml"
+        members = {posixpath.normpath(name): name for name in zip_ref.namelist()}
+        if "manifest.json" not in members:
+            raise FileNotFoundError("No manifest.json found in configuration")
+
+        manifest = json.loads(zip_ref.read(members["manifest.json"]))
+        needed = {
+            posixpath.normpath(template_config["template_file"])
+            for template_config in manifest.get("templates", [])
+            if template_config.get("template_file")
+        }
+        for name in needed & members.keys():
+            templates[name] = zip_ref.read(members[name]).decode()
 
-
-def _download_and_extract_zip(bucket: str, key: str) -> str:
-    """Download and extract zip file from S3 to a temporary directory."""
-    s3_client = boto3.client("s3")
-
-    # Create temporary directory
-    temp_dir = tempfile.mkdtemp()
-    zip_path = os.path.join(temp_dir, "rvm-configuration.zip")
-
-    # Download zip file
-    logger.info(f"Downloading {bucket}/{key} to {zip_path}")
-    s3_client.download_file(bucket, key, zip_path)
-
-    # Extract zip file
-    logger.info(f"Extracting zip file to {temp_dir}")
-    with zipfile.ZipFile(zip_path, "r") as zip_ref:
-        zip_ref.extractall(temp_dir)
-
-    return temp_dir
-
-
-def _read_manifest(manifest_file: str = "manifest.json") -> dict[str, object]:
-    with open(manifest_file, "r") as file:
-        manifest = json.loads(file.read())
-        return manifest
+    return manifest, templates
 
 
 def _assume_role(account_id: str, role_name: str = "RvmWorkflowRole") -> boto3.Session:
     role_arn = f"arn:aws:iam::{account_id}:role/{role_name}"
 
-    sts_client = boto3.client("sts")
+    cached = _assumed_sessions.get(role_arn)
+    if cached and cached[1] - datetime.now(timezone.utc) > SESSION_REUSE_MARGIN:
+        logger.info("Reusing session for role %s", role_arn)
+        return cached[0]
+
+    sts_client = _client("sts")
     response = sts_client.assume_role(
         RoleArn=role_arn, RoleSessionName=f"rvm-deployment-{account_id}"
     )
@@ -49,93 +131,574 @@ def _assume_role(account_id: str, role_name: str = "RvmWorkflowRole") -> boto3.S
         aws_secret_access_key=response["Credentials"]["SecretAccessKey"],
         aws_session_token=response["Credentials"]["SessionToken"],
     )
+    _assumed_sessions[role_arn] = (session, response["Credentials"]["Expiration"])
 
-    logger.info(f"Successfully assumed role {role_arn}")
+    logger.info("Successfully assumed role %s", role_arn)
     return session
 
 
-def _read_template_file(template_file: str) -> str:
-    with open(template_file, "r") as file:
-        template_content = file.read()
-        return template_content
+def _get_existing_stacks(session: boto3.Session) -> dict[str, dict]:
+    """Get all existing RVM-managed stacks in the account with their status and tags.
 
-
-def _get_existing_stacks(session: boto3.Session) -> dict[str, str]:
-    """Get all existing RVM-managed stacks in the account with their status."""
-    cloudformation = session.client("cloudformation", region_name=REGION)
+    Stacks are found by name prefix rather than by tag, as stacks deployed before
+    tagging was introduced, or whose tagging update rolled back, carry no tags.
+    """
+    # describe_stacks returns tags inline, so the template hash is available
+    # without a further call per stack.
+    cloudformation = _session_client(session, "cloudformation")
     existing_stacks = {}
 
+    # Hoisted into locals as this loop can run over thousands of stacks
+    prefix = STACK_PREFIX
+    deployed = DEPLOYED_STATUSES
+
     try:
-        paginator = cloudformation.get_paginator("list_stacks")
-        for page in paginator.paginate(
-            StackStatusFilter=["CREATE_COMPLETE", "UPDATE_COMPLETE"]
-        ):
-            for stack in page["StackSummaries"]:
-                if stack["StackName"].startswith(STACK_PREFIX):
-                    existing_stacks[stack["StackName"]] = stack["StackStatus"]
+        paginator = cloudformation.get_paginator("describe_stacks")
+        for page in paginator.paginate():
+            for stack in page["Stacks"]:
+                if not (name := stack["StackName"]).startswith(prefix):
+                    continue
+                # describe_stacks can't filter by status server-side
+                if (status := stack["StackStatus"]) not in deployed:
+                    continue
+                existing_stacks[name] = {
+                    "status": status,
+                    "tags": {tag["Key"]: tag["Value"] for tag in stack.get("Tags", [])},
+                }
     except Exception as e:
-        logger.warning(f"Failed to list existing stacks: {e}")
+        logger.warning("Failed to list existing stacks: %s", e)
 
     return existing_stacks
 
 
-def _delete_stack(session: boto3.Session, stack_name: str, account_id: str) -> bool:
-    """Delete a CloudFormation stack and wait for completion."""
-    cloudformation = session.client("cloudformation", region_name=REGION)
+def _start_delete_stack(
+    session: boto3.Session, stack_name: str, account_id: str
+) -> bool:
+    """Start deletion of a CloudFormation stack without waiting for it to finish."""
+    cloudformation = _session_client(session, "cloudformation")
 
     try:
         cloudformation.delete_stack(StackName=stack_name)
-        logger.info(f"Started deletion of stack '{stack_name}' in account {account_id}")
+        logger.info(
+            "Started deletion of stack '%s' in account %s", stack_name, account_id
+        )
+        return True
+    except Exception as e:
+        logger.error(
+            "Failed to delete stack '%s' in account %s: %s", stack_name, account_id, e
+        )
+        return False
+
 
-        # Wait for stack deletion to complete
-        waiter = cloudformation.get_waiter("stack_delete_complete")
-        waiter.wait(StackName=stack_name)
+def _wait_delete_fast(
+    cloudformation,
+    stack_name: str,
+    initial: float = 2,
+    cap: float = 15,
+    timeout: float = 600,
+) -> None:
+    """Poll until a stack is deleted, backing off from `initial` up to `cap` seconds.
+
+    The stack_delete_complete waiter polls every 30 seconds, which is mostly idle
+    time for the small stacks RVM manages.
+    """
+    deadline = time.monotonic() + timeout
+    delay = initial
+    while True:
+        try:
+            response = cloudformation.describe_stacks(StackName=stack_name)
+        except ClientError as e:
+            # describe_stacks raises a ValidationError once the stack is gone
+            if e.response["Error"]["Code"] == "ValidationError":
+                return
+            raise
+
+        status = response["Stacks"][0]["StackStatus"]
+        if status == "DELETE_COMPLETE":
+            return
+        if status == "DELETE_FAILED":
+            raise RuntimeError(f"Stack '{stack_name}' failed to delete")
+        if time.monotonic() + delay > deadline:
+            raise TimeoutError(f"Timed out waiting for stack '{stack_name}' to delete")
+
+        time.sleep(delay)
+        delay = min(delay * 2, cap)
+
+
+def _wait_change_sets_fast(
+    cloudformation,
+    change_sets: dict[str, str],
+    initial: float = 1,
+    cap: float = 5,
+    timeout: float = 300,
+) -> dict[str, dict]:
+    """Poll change sets, by stack name, until each has been created or has failed.
+
+    The change sets are polled together, so a wave of updates waits about as
+    long as its slowest change set. Returns the change sets that settled by
+    stack name; any still being created at the timeout are left out.
+    """
+    deadline = time.monotonic() + timeout
+    delay = initial
+    pending = dict(change_sets)
+    settled = {}
+    while pending:
+        for stack_name, change_set_name in list(pending.items()):
+            change_set = cloudformation.describe_change_set(
+                StackName=stack_name, ChangeSetName=change_set_name
+            )
+            if change_set["Status"] in ("CREATE_COMPLETE", "FAILED"):
+                settled[stack_name] = change_set
+                del pending[stack_name]
+        if not pending or time.monotonic() + delay > deadline:
+            break
+
+        time.sleep(delay)
+        delay = min(delay * 2, cap)
+
+    return settled
+
+
+def _create_change_set(
+    cloudformation, stack_name: str, template_content: str, tags: list[dict]
+) -> str:
+    """Start creating a change set to update a stack, returning its name.
+
+    Unlike update_stack, a change set with no changes fails cleanly instead of
+    raising, and leaves an audit trail of what each update did.
+    """
+    change_set_name = f"rvm-{uuid.uuid4().hex}"
+    cloudformation.create_change_set(
+        StackName=stack_name,
+        TemplateBody=template_content,
+        ChangeSetName=change_set_name,
+        ChangeSetType="UPDATE",
+        Capabilities=["CAPABILITY_NAMED_IAM"],
+        Tags=tags,
+    )
+    return change_set_name
+
+
+def _tag_stack(cloudformation, stack_name: str, tags: list[dict]) -> None:
+    """Apply tags to a stack without changing its template."""
+    try:
+        cloudformation.update_stack(
+            StackName=stack_name,
+            UsePreviousTemplate=True,
+            Capabilities=["CAPABILITY_NAMED_IAM"],
+            Tags=tags,
+        )
+    except ClientError as e:
+        # The stack already has these tags
+        if "No updates" not in e.response["Error"]["Message"]:
+            raise
+
+
+def _finish_change_set(
+    cloudformation,
+    stack_name: str,
+    change_set_name: str,
+    change_set: dict | None,
+    tags: list[dict],
+) -> bool:
+    """Execute a change set once created, returning False if nothing changed.
+
+    `change_set` is the settled change set, or None if it wasn't created in
+    time. A stack with no changes is still tagged, so that its template hash
+    is recorded and the next deployment of the same template is skipped.
+    """
+    # Anything short of executing it leaves the change set to clean up
+    executed = False
+    try:
+        if change_set is None:
+            raise TimeoutError(
+                f"Timed out waiting for change set '{change_set_name}' on stack "
+                f"'{stack_name}'"
+            )
+        if change_set["Status"] == "FAILED":
+            reason = change_set.get("StatusReason", "")
+            if "didn't contain changes" in reason or "No updates" in reason:
+                try:
+                    _tag_stack(cloudformation, stack_name, tags)
+                except Exception as e:
+                    logger.warning("Failed to tag stack '%s': %s", stack_name, e)
+                return False
+            raise RuntimeError(f"Change set for stack '{stack_name}' failed: {reason}")
+
+        cloudformation.execute_change_set(
+            StackName=stack_name, ChangeSetName=change_set_name
+        )
+        executed = True
+        return True
+    finally:
+        if not executed:
+            try:
+                cloudformation.delete_change_set(
+                    StackName=stack_name, ChangeSetName=change_set_name
+                )
+            except Exception as e:
+                logger.warning(
+                    "Failed to delete change set '%s' on stack '%s': %s",
+                    change_set_name,
+                    stack_name,
+                    e,
+                )
+
+
+def _wait_delete_stack(
+    session: boto3.Session,
+    stack_name: str,
+    account_id: str,
+    deadline: float | None = None,
+) -> bool:
+    """Wait for a previously started stack deletion to complete."""
+    cloudformation = _session_client(session, "cloudformation")
+
+    try:
+        _wait_delete_fast(
+            cloudformation, stack_name, timeout=_timeout_before(deadline, 600)
+        )
 
         logger.info(
-            f"Successfully deleted stack '{stack_name}' in account {account_id}"
+            "Successfully deleted stack '%s' in account %s", stack_name, account_id
         )
         return True
     except Exception as e:
         logger.error(
-            f"Failed to delete stack '{stack_name}' in account {account_id}: {e}"
+            "Failed to delete stack '%s' in account %s: %s", stack_name, account_id, e
         )
         return False
 
 
+def _template_hash(template_content: str) -> str:
+    return hashlib.sha256(template_content.encode()).hexdigest()
+
+
+def _stack_tags(template_hash: str) -> list[dict]:
+    """Get the tags for a stack deployed with the template of the given hash."""
+    return [MANAGED_TAG, {"Key": TEMPLATE_HASH_TAG, "Value": template_hash}]
+
+
 def _deploy_stack(
     session: boto3.Session,
     template_content: str,
     stack_name: str,
     account_id: str,
-    existing_stacks: dict[str, str],
-) -> bool:
-    cloudformation = session.client("cloudformation", region_name=REGION)
+    existing_stacks: dict[str, dict],
+) -> str | None:
+    """Start deploying a stack, returning the change set created to update it.
+
+    New stacks are created directly and unchanged stacks are skipped, for
+    which None is returned.
+    """
+    cloudformation = _session_client(session, "cloudformation")
+    template_hash = _template_hash(template_content)
+    tags = _stack_tags(template_hash)
 
     # Check if stack exists in our tracked stacks
     if stack_name in existing_stacks:
-        logger.info(f"Stack '{stack_name}' exists in account {account_id}, updating...")
+        existing_stack = existing_stacks[stack_name]
+        if existing_stack["tags"].get(TEMPLATE_HASH_TAG) == template_hash:
+            # A failed deployment keeps its hash tag, so only trust it on success
+            if existing_stack["status"] in DEPLOYED_STATUSES:
+                logger.info(
+                    "Stack '%s' in account %s is unchanged, skipping",
+                    stack_name,
+                    account_id,
+                )
+                return None
 
-        # Update the existing stack
-        cloudformation.update_stack(
-            StackName=stack_name,
-            TemplateBody=template_content,
-            Capabilities=["CAPABILITY_NAMED_IAM"],
+        logger.info(
+            "Stack '%s' exists in account %s, updating...", stack_name, account_id
         )
 
-        logger.info(f"Started update of stack '{stack_name}' in account {account_id}")
-        return True
+        # Update the existing stack once its change set is created
+        return _create_change_set(cloudformation, stack_name, template_content, tags)
     else:
         # Stack doesn't exist, create it
-        logger.info(f"Creating new stack '{stack_name}' in account {account_id}")
+        logger.info("Creating new stack '%s' in account %s", stack_name, account_id)
 
         cloudformation.create_stack(
             StackName=stack_name,
             TemplateBody=template_content,
             Capabilities=["CAPABILITY_NAMED_IAM"],
+            Tags=tags,
         )
 
-        logger.info(f"Started creation of stack '{stack_name}' in account {account_id}")
-        return True
+        logger.info(
+            "Started creation of stack '%s' in account %s", stack_name, account_id
+        )
+        return None
+
+
+def _prepare_account(
+    account_id: str, expected_stacks: set[str]
+) -> tuple[str, boto3.Session, dict[str, dict], set[str]]:
+    """Assume into an account and find the RVM stacks no longer in the manifest."""
+    session = _assume_role(account_id)
+    existing_stacks = _get_existing_stacks(session)
+    orphaned_stacks = set(existing_stacks.keys()) - expected_stacks
+    return account_id, session, existing_stacks, orphaned_stacks
+
+
+def _wait_stack_fast(
+    cloudformation,
+    stack_name: str,
+    initial: float = 2,
+    cap: float = 15,
+    timeout: float = 600,
+) -> bool:
+    """Poll until a stack create settles, returning whether it succeeded.
+
+    Updates are waited for through their change set instead, see
+    `_wait_change_set_executed_fast`.
+    """
+    deadline = time.monotonic() + timeout
+    delay = initial
+    while True:
+        response = cloudformation.describe_stacks(StackName=stack_name)
+        status = response["Stacks"][0]["StackStatus"]
+        if status in DEPLOYED_STATUSES:
+            return True
+        # Anything else that has settled is a rollback or a failure
+        if not status.endswith("_IN_PROGRESS"):
+            return False
+        if time.monotonic() + delay > deadline:
+            raise TimeoutError(f"Timed out waiting for stack '{stack_name}'")
+
+        time.sleep(delay)
+        delay = min(delay * 2, cap)
+
+
+def _wait_change_set_executed_fast(
+    cloudformation,
+    stack_name: str,
+    change_set_name: str,
+    initial: float = 2,
+    cap: float = 15,
+    timeout: float = 600,
+) -> bool:
+    """Poll until an executed change set finishes, returning whether it succeeded.
+
+    Right after execute_change_set the stack can still report the status of its
+    previous deployment, so the change set is watched rather than the stack.
+    """
+    deadline = time.monotonic() + timeout
+    delay = initial
+    while True:
+        change_set = cloudformation.describe_change_set(
+            StackName=stack_name, ChangeSetName=change_set_name
+        )
+        status = change_set["ExecutionStatus"]
+        if status == "EXECUTE_COMPLETE":
+            return True
+        if status in ("EXECUTE_FAILED", "OBSOLETE"):
+            return False
+        if time.monotonic() + delay > deadline:
+            raise TimeoutError(
+                f"Timed out waiting for change set '{change_set_name}' on stack "
+                f"'{stack_name}'"
+            )
+
+        time.sleep(delay)
+        delay = min(delay * 2, cap)
+
+
+def _deploy_account(
+    account_id: str,
+    templates: list[tuple[str, str, str]],
+    context: tuple[boto3.Session, dict[str, dict]],
+    dependencies: dict[str, set[str]],
+    deadline: float | None = None,
+) -> dict[tuple[str, str], bool]:
+    """Deploy an account's (template_file, stack_name, template_content) entries.
+
+    Templates are deployed in waves in dependency order. Every template whose
+    dependencies are met is started, with the change sets for a wave's updates
+    created together and then executed, then the stacks that later templates
+    depend on are waited for before the next wave. Calls within an account are
+    made one after another, which keeps it clear of CloudFormation throttling.
+    Waits end by the monotonic deadline, after which remaining templates are
+    failed.
+    """
+    # Reuse the session from discovery; the Lambda's 15 minute timeout
+    # is well within the default 1 hour lifetime of the STS credentials
+    session, existing_stacks = context
+    cloudformation = _session_client(session, "cloudformation")
+    succeeded = {}
+
+    # Dependencies name templates by their normalised path
+    entries = {
+        posixpath.normpath(template_file): (template_file, stack_name, template_content)
+        for template_file, stack_name, template_content in templates
+    }
+    # Dependencies on templates not deployed to this account are never met
+    remaining = {
+        template_file: set(dependencies.get(template_file, ()))
+        for template_file in entries
+    }
+
+    while remaining:
+        if deadline is not None and time.monotonic() >= deadline:
+            for template_file in remaining:
+                logger.error(
+                    "Cannot deploy %s to account %s: out of time",
+                    template_file,
+                    account_id,
+                )
+                succeeded[template_file] = False
+            break
+
+        wave = [template_file for template_file, deps in remaining.items() if not deps]
+        if not wave:
+            for template_file, deps in remaining.items():
+                logger.error(
+                    "Cannot deploy %s to account %s: unresolved dependencies %s",
+                    template_file,
+                    account_id,
+                    sorted(deps),
+                )
+                succeeded[template_file] = False
+            break
+
+        change_sets = {}  # template_file: change_set_name
+        for template_file in wave:
+            del remaining[template_file]
+            _, stack_name, template_content = entries[template_file]
+            try:
+                change_set_name = _deploy_stack(
+                    session,
+                    template_content,
+                    stack_name,
+                    account_id,
+                    existing_stacks,
+                )
+            except Exception as e:
+                logger.error(
+                    "Failed to deploy %s to account %s: %s",
+                    template_file,
+                    account_id,
+                    e,
+                )
+                succeeded[template_file] = False
+                continue
+
+            succeeded[template_file] = True
+            if change_set_name:
+                change_sets[template_file] = change_set_name
+
+        # Change sets for the whole wave are created before any is executed
+        settled = {}
+        if change_sets:
+            try:
+                settled = _wait_change_sets_fast(
+                    cloudformation,
+                    {
+                        entries[template_file][1]: change_set_name
+                        for template_file, change_set_name in change_sets.items()
+                    },
+                    timeout=_timeout_before(deadline, 300),
+                )
+            except Exception as e:
+                logger.error(
+                    "Failed waiting for change sets in account %s: %s", account_id, e
+                )
+
+        executed = set()
+        for template_file, change_set_name in change_sets.items():
+            _, stack_name, template_content = entries[template_file]
+            try:
+                if _finish_change_set(
+                    cloudformation,
+                    stack_name,
+                    change_set_name,
+                    settled.get(stack_name),
+                    _stack_tags(_template_hash(template_content)),
+                ):
+                    executed.add(template_file)
+                    logger.info(
+                        "Started update of stack '%s' in account %s",
+                        stack_name,
+                        account_id,
+                    )
+                else:
+                    logger.info(
+                        "Stack '%s' in account %s has no changes",
+                        stack_name,
+                        account_id,
+                    )
+            except Exception as e:
+                logger.error(
+                    "Failed to deploy %s to account %s: %s",
+                    template_file,
+                    account_id,
+                    e,
+                )
+                succeeded[template_file] = False
+
+        # Upstream stacks must finish before their dependents can use them
+        upstream = set().union(*remaining.values()) if remaining else set()
+        for template_file in wave:
+            if template_file not in upstream:
+                continue
+            if not succeeded[template_file]:
+                continue
+            if template_file in change_sets and template_file not in executed:
+                # Nothing changed, so there is nothing to wait for
+                continue
+            _, stack_name, _ = entries[template_file]
+            logger.info("Waiting for stack '%s' in account %s", stack_name, account_id)
+            try:
+                if template_file in executed:
+                    ok = _wait_change_set_executed_fast(
+                        cloudformation,
+                        stack_name,
+                        change_sets[template_file],
+                        timeout=_timeout_before(deadline, 600),
+                    )
+                else:
+                    ok = _wait_stack_fast(
+                        cloudformation,
+                        stack_name,
+                        timeout=_timeout_before(deadline, 600),
+                    )
+            except Exception as e:
+                logger.error(
+                    "Failed waiting for stack '%s' in account %s: %s",
+                    stack_name,
+                    account_id,
+                    e,
+                )
+                ok = False
+            succeeded[template_file] = ok
+
+        # Fail everything downstream of a failure, then release the rest
+        failed = {
+            template_file for template_file in wave if not succeeded[template_file]
+        }
+        while failed:
+            blocked = {
+                template_file
+                for template_file, deps in remaining.items()
+                if deps & failed
+            }
+            for template_file in blocked:
+                logger.error(
+                    "Skipping %s for account %s: a dependency failed",
+                    template_file,
+                    account_id,
+                )
+                succeeded[template_file] = False
+                del remaining[template_file]
+            failed = blocked
+
+        for deps in remaining.values():
+            deps.difference_update(wave)
+
+    return {
+        (entries[template_file][0], account_id): ok
+        for template_file, ok in succeeded.items()
+    }
 
 
 def _generate_stack_name(template_file: str) -> str:
@@ -144,20 +707,30 @@ def _generate_stack_name(template_file: str) -> str:
     return stack_name
 
 
-def deploy_all(extracted_dir: str) -> dict[str, list[str]]:
-    manifest_path = os.path.join(extracted_dir, "manifest.json")
+def deploy_all(
+    manifest: dict[str, object],
+    templates: dict[str, str],
+    wait_for_deletions: bool = False,
+    deadline: float | None = None,
+) -> dict[str, list[str]]:
     results = {"success": [], "failed": [], "deleted": []}
 
-    manifest = _read_manifest(manifest_path)
-
     if "templates" not in manifest:
         logger.warning("No 'templates' section found in manifest")
         return results
 
-    # Track all stacks that should exist according to manifest
-    expected_stacks = set()
-    all_accounts = set()
-    account_stacks = {}  # Track stacks per account for deletion
+    # A single pass over the manifest indexes templates by account, matching the
+    # per-account sessions they are deployed with. Each entry is
+    # (template_file, stack_name, template_content).
+    by_account: dict[str, list[tuple[str, str, str]]] = {}
+    # Stacks the manifest lists per account, whether or not they can be deployed
+    expected_stacks: dict[str, set[str]] = {}
+    # Templates each template needs deployed first, within the same account,
+    # all by normalised path
+    dependencies: dict[str, set[str]] = {}
+    manifest_order = []  # (template_file, account_id), for reporting
+    seen = set()  # (template path, account_id)
+    outcomes = {}
 
     for template_config in manifest["templates"]:
         template_file = template_config.get("template_file")
@@ -168,107 +741,151 @@ def deploy_all(extracted_dir: str) -> dict[str, list[str]]:
             continue
 
         if not accounts:
-            logger.warning(f"No accounts specified for template {template_file}")
+            logger.warning("No accounts specified for template %s", template_file)
             continue
 
-        # Resolve template file path relative to extracted directory
-        template_path = os.path.join(extracted_dir, template_file)
-
-        try:
-            template_content = _read_template_file(template_path)
-        except FileNotFoundError:
-            logger.warning(f"Template file not found: {template_path}")
-            results["failed"].extend(accounts)
-            continue
+        template_path = posixpath.normpath(template_file)
+        # The same template listed again would deploy its stack twice
+        duplicates = [
+            account_id for account_id in accounts if (template_path, account_id) in seen
+        ]
+        if duplicates:
+            logger.warning(
+                "Template %s is listed more than once for accounts %s, ignoring",
+                template_file,
+                duplicates,
+            )
+            accounts = [
+                account_id for account_id in accounts if account_id not in duplicates
+            ]
+        seen.update((template_path, account_id) for account_id in accounts)
 
         stack_name = _generate_stack_name(template_file)
-        all_accounts.update(accounts)
-
         for account_id in accounts:
-            expected_stacks.add(f"{stack_name}-{account_id}")
-
-            # Track which stacks belong to which account
-            if account_id not in account_stacks:
-                account_stacks[account_id] = set()
-            account_stacks[account_id].add(f"{stack_name}-{account_id}")
-
-    # Get existing stacks for each account and handle deletions first
-    account_existing_stacks = {}
-    for account_id in all_accounts:
-        try:
-            session = _assume_role(account_id)
-            existing_stacks = _get_existing_stacks(session)
-            account_existing_stacks[account_id] = existing_stacks
-
-            # Find stacks that exist but are not in the manifest
-            expected_for_account = account_stacks.get(account_id, set())
-            orphaned_stacks = set(existing_stacks.keys()) - expected_for_account
-
-            # Delete orphaned stacks first
-            for stack_name in orphaned_stacks:
-                if _delete_stack(session, stack_name, account_id):
-                    results["deleted"].append(f"{stack_name}:{account_id}")
-
-        except Exception as e:
-            logger.error(
-                f"Failed to check for orphaned stacks in account {account_id}: {e}"
-            )
-
-    # Now deploy/update stacks
-    for template_config in manifest["templates"]:
-        template_file = template_config.get("template_file")
-        accounts = template_config.get("accounts", [])
-
-        if not template_file:
-            continue
-
-        if not accounts:
+            expected_stacks.setdefault(account_id, set()).add(stack_name)
+
+        # A stack whose template is missing is failed but never deleted as an
+        # orphan, so a packaging mistake can't take down deployed resources
+        template_content = templates.get(template_path)
+        if template_content is None:
+            logger.warning("Template file not found: %s", template_file)
+            for account_id in accounts:
+                outcomes[(template_file, account_id)] = False
+                manifest_order.append((template_file, account_id))
             continue
 
-        template_path = os.path.join(extracted_dir, template_file)
-
-        try:
-            template_content = _read_template_file(template_path)
-        except FileNotFoundError:
-            continue
-
-        stack_name = _generate_stack_name(template_file)
+        # Entries for the same template in different accounts add to each other
+        dependencies.setdefault(template_path, set()).update(
+            posixpath.normpath(dependency)
+            for dependency in template_config.get("depends_on", [])
+        )
 
         for account_id in accounts:
-            try:
-                session = _assume_role(account_id)
-                existing_stacks = account_existing_stacks.get(account_id, {})
-
-                if _deploy_stack(
-                    session, template_content, stack_name, account_id, existing_stacks
-                ):
-                    results["success"].append(f"{template_file}:{account_id}")
-                else:
-                    results["failed"].append(f"{template_file}:{account_id}")
+            by_account.setdefault(account_id, []).append(
+                (template_file, stack_name, template_content)
+            )
+            manifest_order.append((template_file, account_id))
 
+    # Get existing stacks for each account and handle deletions first
+    account_context: dict[str, tuple[boto3.Session, dict[str, dict]]] = {}
+    orphans = []
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {
+            # Stack names are only unique per account
+            account_id: executor.submit(_prepare_account, account_id, stack_names)
+            for account_id, stack_names in expected_stacks.items()
+        }
+        for account_id, future in futures.items():
+            try:
+                _, session, existing_stacks, orphaned_stacks = future.result()
             except Exception as e:
                 logger.error(
-                    f"Failed to deploy {template_file} to account {account_id}: {e}"
+                    "Failed to check for orphaned stacks in account %s: %s",
+                    account_id,
+                    e,
+                )
+                continue
+
+            account_context[account_id] = (session, existing_stacks)
+            orphans.extend(
+                (session, stack_name, account_id) for stack_name in orphaned_stacks
+            )
+
+    # Delete orphaned stacks first. Orphans never share a name with a stack in
+    # the manifest, so by default we don't block on CloudFormation finishing.
+    if orphans:
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            started = list(
+                executor.map(lambda orphan: _start_delete_stack(*orphan), orphans)
+            )
+            orphans = [orphan for orphan, ok in zip(orphans, started) if ok]
+            if wait_for_deletions:
+                deleted = executor.map(
+                    lambda orphan: _wait_delete_stack(*orphan, deadline), orphans
                 )
-                results["failed"].append(f"{template_file}:{account_id}")
+                orphans = [orphan for orphan, ok in zip(orphans, deleted) if ok]
+
+        for _, stack_name, account_id in orphans:
+            results["deleted"].append(f"{stack_name}:{account_id}")
+
+    # Now deploy/update stacks
+    for account_id, entries in by_account.items():
+        if account_id not in account_context:
+            logger.error("Skipping account %s: no session", account_id)
+            for template_file, _, _ in entries:
+                outcomes[(template_file, account_id)] = False
+
+    if account_context:
+        with ThreadPoolExecutor(
+            max_workers=min(MAX_DEPLOY_WORKERS, len(account_context))
+        ) as executor:
+            futures = {
+                executor.submit(
+                    _deploy_account,
+                    account_id,
+                    by_account[account_id],
+                    context,
+                    dependencies,
+                    deadline,
+                ): account_id
+                for account_id, context in account_context.items()
+                if account_id in by_account
+            }
+            for future in as_completed(futures):
+                account_id = futures[future]
+                try:
+                    outcomes.update(future.result())
+                except Exception as e:
+                    logger.error("Failed to deploy to account %s: %s", account_id, e)
+                    for template_file, _, _ in by_account[account_id]:
+                        outcomes[(template_file, account_id)] = False
+
+    # Report in manifest order regardless of completion order
+    for template_file, account_id in manifest_order:
+        key = "success" if outcomes[(template_file, account_id)] else "failed"
+        results[key].append(f"{template_file}:{account_id}")
 
     # Log summary
     logger.info(
-        f"Deployment complete. Successful: {len(results['success'])}, Failed: {len(results['failed'])}, Deleted: {len(results['deleted'])}"
+        "Deployment complete. Successful: %s, Failed: %s, Deleted: %s",
+        len(results["success"]),
+        len(results["failed"]),
+        len(results["deleted"]),
     )
     if results["success"]:
-        logger.info(f"Successful deployments: {results['success']}")
+        logger.info("Successful deployments: %s", results["success"])
     if results["failed"]:
-        logger.warning(f"Failed deployments: {results['failed']}")
+        logger.warning("Failed deployments: %s", results["failed"])
     if results["deleted"]:
-        logger.info(f"Deleted stacks: {results['deleted']}")
+        logger.info("Deleted stacks: %s", results["deleted"])
 
     return results
 
 
 def lambda_handler(event, context):
     """Lambda handler function."""
-    logger.info(f"Received event: {json.dumps(event)}")
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("Received event: %s", json.dumps(event))
 
     try:
         # Extract S3 bucket and key from the event
@@ -276,13 +893,19 @@ def lambda_handler(event, context):
         bucket = s3_event["bucket"]["name"]
         key = s3_event["object"]["key"]
 
-        logger.info(f"Processing S3 object: {bucket}/{key}")
+        logger.info("Processing S3 object: %s/%s", bucket, key)
 
         # Download and extract the zip file
-        extracted_dir = _download_and_extract_zip(bucket, key)
+        manifest, templates = _download_and_extract_zip(bucket, key)
+
+        # Stop waiting on CloudFormation in time to report before being killed
+        deadline = None
+        if context is not None:
+            remaining = context.get_remaining_time_in_millis() / 1000
+            deadline = time.monotonic() + remaining - DEADLINE_MARGIN
 
         # Deploy all templates
-        results = deploy_all(extracted_dir)
+        results = deploy_all(manifest, templates, deadline=deadline)
 
         return {
             "statusCode": 200,
@@ -297,5 +920,5 @@ def lambda_handler(event, context):
         }
 
     except Exception as e:
-        logger.error(f"Error processing deployment: {e}")
+        logger.error("Error processing deployment: %s", e)
         return {"statusCode": 500, "body": json.dumps({"error": str(e)})}
@@ -1,10 +1,13 @@
+import hashlib
 import io
 import json
 import zipfile
+from datetime import datetime, timezone
 
 import moto
 import boto3
 import pytest
+from botocore.exceptions import ClientError
 
 
 PIPELINE_BUCKET = "RvmPipelineBucket"
@@ -16,6 +19,8 @@ def handler(monkeypatch):
     monkeypatch.setenv("AWS_REGION", "us-east-1")
     from rvm import rvm
 
+    # Sessions cached by a previous test belong to a torn down moto backend
+    rvm._assumed_sessions.clear()
     yield rvm.lambda_handler
 
 
@@ -73,3 +78,731 @@ def test_create_stack(handler):
         "templates/stack2.template:222222222222",
     ]
     assert body["failed"] == []
+
+
+TEMPLATE1_YAML = "Resources:\n  MyBucket:\n    Type: AWS::S3::Bucket\n"
+TEMPLATE2_YAML = "Resources:\n  MyOtherBucket:\n    Type: AWS::S3::Bucket\n"
+
+EVENT = {
+    "Records": [
+        {
+            "s3": {
+                "bucket": {"name": PIPELINE_BUCKET},
+                "object": {"key": CONFIG_FILE},
+            }
+        },
+    ]
+}
+
+
+def _upload_configuration(manifest, templates):
+    s3 = boto3.resource("s3", region_name="us-east-1")
+    pipeline_bucket = s3.Bucket(PIPELINE_BUCKET)
+    if pipeline_bucket.creation_date is None:
+        s3.create_bucket(Bucket=PIPELINE_BUCKET)
+
+    zip_buffer = io.BytesIO()
+    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zipf:
+        zipf.writestr("manifest.json", json.dumps(manifest))
+        for template_file, template_body in templates.items():
+            zipf.writestr(template_file, template_body)
+
+    zip_buffer.seek(0)
+    pipeline_bucket.upload_fileobj(zip_buffer, CONFIG_FILE)
+
+
+@moto.mock_aws
+def test_delete_orphaned_stack(handler):
+    templates = {
+        "templates/stack1.template": TEMPLATE1_YAML,
+        "templates/stack2.template": TEMPLATE2_YAML,
+    }
+    _upload_configuration(
+        {
+            "templates": [
+                {
+                    "template_file": "templates/stack1.template",
+                    "accounts": ["222222222222"],
+                },
+                {
+                    "template_file": "templates/stack2.template",
+                    "accounts": ["222222222222"],
+                },
+            ]
+        },
+        templates,
+    )
+    response = handler(EVENT, None)
+    assert response["statusCode"] == 200
+
+    _upload_configuration(
+        {
+            "templates": [
+                {
+                    "template_file": "templates/stack1.template",
+                    "accounts": ["222222222222"],
+                },
+            ]
+        },
+        templates,
+    )
+    response = handler(EVENT, None)
+    assert response["statusCode"] == 200
+
+    body = json.loads(response["body"])
+    assert body["success"] == ["templates/stack1.template:222222222222"]
+    assert body["failed"] == []
+    assert body["deleted"] == ["rvm-provisioned-stack2:222222222222"]
+
+
+@moto.mock_aws
+def test_missing_template_is_not_orphaned(handler):
+    manifest = {
+        "templates": [
+            {
+                "template_file": "templates/stack1.template",
+                "accounts": ["222222222222"],
+            },
+            {
+                "template_file": "templates/stack2.template",
+                "accounts": ["222222222222"],
+            },
+        ]
+    }
+    _upload_configuration(
+        manifest,
+        {
+            "templates/stack1.template": TEMPLATE1_YAML,
+            "templates/stack2.template": TEMPLATE2_YAML,
+        },
+    )
+    assert handler(EVENT, None)["statusCode"] == 200
+
+    _upload_configuration(manifest, {"templates/stack1.template": TEMPLATE1_YAML})
+    response = handler(EVENT, None)
+    assert response["statusCode"] == 200
+
+    body = json.loads(response["body"])
+    assert body["success"] == ["templates/stack1.template:222222222222"]
+    assert body["failed"] == ["templates/stack2.template:222222222222"]
+    assert body["deleted"] == []
+
+
+def _cloudformation(account_id):
+    credentials = boto3.client("sts", region_name="us-east-1").assume_role(
+        RoleArn=f"arn:aws:iam::{account_id}:role/RvmWorkflowRole",
+        RoleSessionName="test",
+    )["Credentials"]
+    return boto3.client(
+        "cloudformation",
+        region_name="us-east-1",
+        aws_access_key_id=credentials["AccessKeyId"],
+        aws_secret_access_key=credentials["SecretAccessKey"],
+        aws_session_token=credentials["SessionToken"],
+    )
+
+
+def _stack_status(account_id, stack_name):
+    stacks = _cloudformation(account_id).describe_stacks(StackName=stack_name)
+    return stacks["Stacks"][0]["StackStatus"]
+
+
+@moto.mock_aws
+def test_skip_unchanged_stack(handler):
+    manifest = {
+        "templates": [
+            {
+                "template_file": "templates/stack1.template",
+                "accounts": ["222222222222"],
+            },
+            {
+                "template_file": "templates/stack2.template",
+                "accounts": ["222222222222"],
+            },
+        ]
+    }
+    _upload_configuration(
+        manifest,
+        {
+            "templates/stack1.template": TEMPLATE1_YAML,
+            "templates/stack2.template": TEMPLATE2_YAML,
+        },
+    )
+    assert handler(EVENT, None)["statusCode"] == 200
+
+    _upload_configuration(
+        manifest,
+        {
+            "templates/stack1.template": TEMPLATE1_YAML,
+            "templates/stack2.template": TEMPLATE1_YAML,
+        },
+    )
+    response = handler(EVENT, None)
+    assert response["statusCode"] == 200
+
+    body = json.loads(response["body"])
+    assert body["success"] == [
+        "templates/stack1.template:222222222222",
+        "templates/stack2.template:222222222222",
+    ]
+    assert _stack_status("222222222222", "rvm-provisioned-stack1") == "CREATE_COMPLETE"
+    assert _stack_status("222222222222", "rvm-provisioned-stack2") == "UPDATE_COMPLETE"
+
+
+@moto.mock_aws
+def test_deploy_with_dependencies(handler):
+    _upload_configuration(
+        {
+            "templates": [
+                {
+                    "template_file": "templates/stack2.template",
+                    "accounts": ["222222222222"],
+                    "depends_on": ["templates/stack1.template"],
+                },
+                {
+                    "template_file": "templates/stack1.template",
+                    "accounts": ["222222222222"],
+                },
+                {
+                    "template_file": "templates/stack3.template",
+                    "accounts": ["222222222222"],
+                    "depends_on": ["templates/missing.template"],
+                },
+            ]
+        },
+        {
+            "templates/stack1.template": TEMPLATE1_YAML,
+            "templates/stack2.template": TEMPLATE2_YAML,
+            "templates/stack3.template": TEMPLATE2_YAML,
+        },
+    )
+
+    response = handler(EVENT, None)
+    assert response["statusCode"] == 200
+
+    body = json.loads(response["body"])
+    assert body["success"] == [
+        "templates/stack2.template:222222222222",
+        "templates/stack1.template:222222222222",
+    ]
+    assert body["failed"] == ["templates/stack3.template:222222222222"]
+    assert _stack_status("222222222222", "rvm-provisioned-stack2") == "CREATE_COMPLETE"
+
+
+@moto.mock_aws
+def test_dependencies_match_normalised_paths(handler):
+    _upload_configuration(
+        {
+            "templates": [
+                {
+                    "template_file": "./templates/stack1.template",
+                    "accounts": ["222222222222"],
+                },
+                {
+                    "template_file": "templates/stack2.template",
+                    "accounts": ["222222222222"],
+                    "depends_on": ["templates/stack1.template"],
+                },
+                {
+                    "template_file": "templates/stack2.template",
+                    "accounts": ["222222222222", "111111111111"],
+                    "depends_on": ["./templates/stack1.template"],
+                },
+            ]
+        },
+        {
+            "templates/stack1.template": TEMPLATE1_YAML,
+            "templates/stack2.template": TEMPLATE2_YAML,
+        },
+    )
+
+    response = handler(EVENT, None)
+    assert response["statusCode"] == 200
+
+    # The repeated account is deployed once, and stack1 is never deployed to
+    # the other account that stack2 depends on it in
+    body = json.loads(response["body"])
+    assert body["success"] == [
+        "./templates/stack1.template:222222222222",
+        "templates/stack2.template:222222222222",
+    ]
+    assert body["failed"] == ["templates/stack2.template:111111111111"]
+
+
+class _ExecutingChangeSet:
+    """Stands in for a CloudFormation client while a change set executes."""
+
+    def __init__(self, statuses):
+        self.statuses = list(statuses)
+
+    def describe_change_set(self, StackName, ChangeSetName):
+        return {"ExecutionStatus": self.statuses.pop(0)}
+
+
+@moto.mock_aws
+def test_dependents_wait_for_executed_change_set(handler, monkeypatch):
+    from rvm import rvm
+
+    session = boto3.Session(region_name="us-east-1")
+    session.client("cloudformation").create_stack(
+        StackName="rvm-provisioned-stack1", TemplateBody=TEMPLATE1_YAML
+    )
+    existing_stacks = rvm._get_existing_stacks(session)
+
+    monkeypatch.setattr(rvm.time, "sleep", lambda delay: None)
+    cloudformation = _ExecutingChangeSet(
+        ["EXECUTE_IN_PROGRESS", "EXECUTE_IN_PROGRESS", "EXECUTE_COMPLETE"]
+    )
+    client = rvm._session_client(session, "cloudformation")
+    monkeypatch.setattr(
+        client, "describe_change_set", cloudformation.describe_change_set
+    )
+    monkeypatch.setattr(
+        rvm,
+        "_wait_change_sets_fast",
+        lambda cloudformation, change_sets, **kwargs: {
+            stack_name: {"Status": "CREATE_COMPLETE"} for stack_name in change_sets
+        },
+    )
+
+    outcomes = rvm._deploy_account(
+        "123456789012",
+        [
+            ("templates/stack1.template", "rvm-provisioned-stack1", TEMPLATE2_YAML),
+            ("templates/stack2.template", "rvm-provisioned-stack2", TEMPLATE1_YAML),
+        ],
+        (session, existing_stacks),
+        {"templates/stack2.template": {"templates/stack1.template"}},
+    )
+
+    assert outcomes == {
+        ("templates/stack1.template", "123456789012"): True,
+        ("templates/stack2.template", "123456789012"): True,
+    }
+    # The stack reported its previous deployment straight away, so stack2 was
+    # only started once stack1's change set had finished executing
+    assert cloudformation.statuses == []
+
+
+def test_wait_change_set_executed(handler, monkeypatch):
+    from rvm import rvm
+
+    monkeypatch.setattr(rvm.time, "sleep", lambda delay: None)
+
+    assert rvm._wait_change_set_executed_fast(
+        _ExecutingChangeSet(["EXECUTE_IN_PROGRESS", "EXECUTE_COMPLETE"]),
+        "rvm-provisioned-stack1",
+        "rvm-change-set",
+    )
+    assert not rvm._wait_change_set_executed_fast(
+        _ExecutingChangeSet(["EXECUTE_IN_PROGRESS", "EXECUTE_FAILED"]),
+        "rvm-provisioned-stack1",
+        "rvm-change-set",
+    )
+
+
+@moto.mock_aws
+def test_discover_tagged_and_untagged_stacks(handler):
+    from rvm import rvm
+
+    cloudformation = _cloudformation("222222222222")
+    for stack_name in ("rvm-provisioned-legacy", "rvm-provisioned-gone"):
+        cloudformation.create_stack(StackName=stack_name, TemplateBody=TEMPLATE1_YAML)
+    for stack_name in ("rvm-provisioned-tagged", "rvm-provisioned-deleted"):
+        cloudformation.create_stack(
+            StackName=stack_name, TemplateBody=TEMPLATE2_YAML, Tags=[rvm.MANAGED_TAG]
+        )
+    # A deleted stack is created afresh, whatever tags it had
+    cloudformation.delete_stack(StackName="rvm-provisioned-deleted")
+
+    _upload_configuration(
+        {
+            "templates": [
+                {
+                    "template_file": "templates/legacy.template",
+                    "accounts": ["222222222222"],
+                },
+                {
+                    "template_file": "templates/tagged.template",
+                    "accounts": ["222222222222"],
+                },
+                {
+                    "template_file": "templates/deleted.template",
+                    "accounts": ["222222222222"],
+                },
+            ]
+        },
+        {
+            "templates/legacy.template": TEMPLATE2_YAML,
+            "templates/tagged.template": TEMPLATE1_YAML,
+            "templates/deleted.template": TEMPLATE1_YAML,
+        },
+    )
+
+    response = handler(EVENT, None)
+    assert response["statusCode"] == 200
+
+    body = json.loads(response["body"])
+    assert body["success"] == [
+        "templates/legacy.template:222222222222",
+        "templates/tagged.template:222222222222",
+        "templates/deleted.template:222222222222",
+    ]
+    assert body["failed"] == []
+    assert body["deleted"] == ["rvm-provisioned-gone:222222222222"]
+    assert _stack_status("222222222222", "rvm-provisioned-legacy") == "UPDATE_COMPLETE"
+    assert _stack_status("222222222222", "rvm-provisioned-tagged") == "UPDATE_COMPLETE"
+    assert _stack_status("222222222222", "rvm-provisioned-deleted") == "CREATE_COMPLETE"
+
+
+@moto.mock_aws
+def test_skip_unchanged_stack_only_when_deployed(handler, monkeypatch):
+    from rvm import rvm
+
+    session = boto3.Session(region_name="us-east-1")
+    session.client("cloudformation").create_stack(
+        StackName="rvm-provisioned-stack1", TemplateBody=TEMPLATE1_YAML
+    )
+    template_hash = hashlib.sha256(TEMPLATE1_YAML.encode()).hexdigest()
+
+    updates = []
+    create_change_set = rvm._create_change_set
+
+    def _record_update(*args, **kwargs):
+        updates.append(args[1])
+        return create_change_set(*args, **kwargs)
+
+    monkeypatch.setattr(rvm, "_create_change_set", _record_update)
+
+    for status in ("UPDATE_COMPLETE", "ROLLBACK_COMPLETE"):
+        existing_stacks = {
+            "rvm-provisioned-stack1": {
+                "status": status,
+                "tags": {rvm.TEMPLATE_HASH_TAG: template_hash},
+            }
+        }
+        rvm._deploy_stack(
+            session,
+            TEMPLATE1_YAML,
+            "rvm-provisioned-stack1",
+            "123456789012",
+            existing_stacks,
+        )
+
+    # Only the stack known to have failed is redeployed
+    assert updates == ["rvm-provisioned-stack1"]
+
+
+@moto.mock_aws
+def test_template_paths_are_normalised(handler):
+    manifest = {
+        "templates": [
+            {
+                "template_file": "./templates/stack1.template",
+                "accounts": ["222222222222"],
+            },
+            {
+                "template_file": "templates/stack2.template",
+                "accounts": ["222222222222"],
+            },
+        ]
+    }
+    templates = {
+        "templates/stack1.template": TEMPLATE1_YAML,
+        "templates/stack2.template": TEMPLATE2_YAML,
+    }
+    _upload_configuration(manifest, templates)
+    assert handler(EVENT, None)["statusCode"] == 200
+
+    _upload_configuration(manifest, templates)
+    response = handler(EVENT, None)
+    assert response["statusCode"] == 200
+
+    body = json.loads(response["body"])
+    assert body["success"] == [
+        "./templates/stack1.template:222222222222",
+        "templates/stack2.template:222222222222",
+    ]
+    assert body["failed"] == []
+    assert body["deleted"] == []
+
+
+class _LambdaContext:
+    def __init__(self, remaining_millis):
+        self.remaining_millis = remaining_millis
+
+    def get_remaining_time_in_millis(self):
+        return self.remaining_millis
+
+
+@moto.mock_aws
+def test_out_of_time(handler):
+    from rvm import rvm
+
+    _upload_configuration(
+        {
+            "templates": [
+                {
+                    "template_file": "templates/stack1.template",
+                    "accounts": ["222222222222"],
+                },
+                {
+                    "template_file": "templates/stack2.template",
+                    "accounts": ["222222222222"],
+                    "depends_on": ["templates/stack1.template"],
+                },
+            ]
+        },
+        {
+            "templates/stack1.template": TEMPLATE1_YAML,
+            "templates/stack2.template": TEMPLATE2_YAML,
+        },
+    )
+
+    # Only the margin kept back for reporting is left
+    context = _LambdaContext(rvm.DEADLINE_MARGIN * 1000)
+    response = handler(EVENT, context)
+    assert response["statusCode"] == 200
+
+    body = json.loads(response["body"])
+    assert body["success"] == []
+    assert body["failed"] == [
+        "templates/stack1.template:222222222222",
+        "templates/stack2.template:222222222222",
+    ]
+
+
+@moto.mock_aws
+def test_account_failure_keeps_other_results(handler, monkeypatch):
+    from rvm import rvm
+
+    deploy_account = rvm._deploy_account
+
+    def _deploy_account(account_id, *args, **kwargs):
+        if account_id == "111111111111":
+            raise RuntimeError("boom")
+        return deploy_account(account_id, *args, **kwargs)
+
+    monkeypatch.setattr(rvm, "_deploy_account", _deploy_account)
+
+    _upload_configuration(
+        {
+            "templates": [
+                {
+                    "template_file": "templates/stack1.template",
+                    "accounts": ["111111111111", "222222222222"],
+                },
+            ]
+        },
+        {"templates/stack1.template": TEMPLATE1_YAML},
+    )
+
+    response = handler(EVENT, None)
+    assert response["statusCode"] == 200
+
+    body = json.loads(response["body"])
+    assert body["success"] == ["templates/stack1.template:222222222222"]
+    assert body["failed"] == ["templates/stack1.template:111111111111"]
+
+
+@moto.mock_aws
+def test_whitespace_only_change_has_no_changes(handler, monkeypatch):
+    from rvm import rvm
+
+    manifest = {
+        "templates": [
+            {
+                "template_file": "templates/stack1.template",
+                "accounts": ["222222222222"],
+            },
+        ]
+    }
+    _upload_configuration(manifest, {"templates/stack1.template": TEMPLATE1_YAML})
+    assert handler(EVENT, None)["statusCode"] == 200
+
+    # The hash differs but CloudFormation sees the same template
+    template_yaml = TEMPLATE1_YAML + "\n\n"
+    _upload_configuration(manifest, {"templates/stack1.template": template_yaml})
+    response = handler(EVENT, None)
+    assert response["statusCode"] == 200
+
+    body = json.loads(response["body"])
+    assert body["success"] == ["templates/stack1.template:222222222222"]
+    cloudformation = _cloudformation("222222222222")
+    change_sets = cloudformation.list_change_sets(StackName="rvm-provisioned-stack1")
+    assert change_sets["Summaries"] == []
+
+    # The new hash is recorded, so the next deployment skips the stack
+    stack = cloudformation.describe_stacks(StackName="rvm-provisioned-stack1")
+    tags = {tag["Key"]: tag["Value"] for tag in stack["Stacks"][0]["Tags"]}
+    assert tags[rvm.TEMPLATE_HASH_TAG] == hashlib.sha256(
+        template_yaml.encode()
+    ).hexdigest()
+
+    updates = []
+    monkeypatch.setattr(
+        rvm, "_create_change_set", lambda *args, **kwargs: updates.append(args[1])
+    )
+    assert handler(EVENT, None)["statusCode"] == 200
+    assert updates == []
+
+
+@moto.mock_aws
+def test_change_sets_are_waited_for_together(handler, monkeypatch):
+    from rvm import rvm
+
+    session = boto3.Session(region_name="us-east-1")
+    cloudformation = session.client("cloudformation")
+    for stack_name in ("rvm-provisioned-stack1", "rvm-provisioned-stack2"):
+        cloudformation.create_stack(StackName=stack_name, TemplateBody=TEMPLATE1_YAML)
+
+    waits = []
+
+    def _timeout(cloudformation, change_sets, **kwargs):
+        waits.append(sorted(change_sets))
+        # No change set is created in time
+        return {}
+
+    monkeypatch.setattr(rvm, "_wait_change_sets_fast", _timeout)
+
+    outcomes = rvm._deploy_account(
+        "123456789012",
+        [
+            ("templates/stack1.template", "rvm-provisioned-stack1", TEMPLATE2_YAML),
+            ("templates/stack2.template", "rvm-provisioned-stack2", TEMPLATE2_YAML),
+        ],
+        (session, rvm._get_existing_stacks(session)),
+        {},
+    )
+
+    assert waits == [["rvm-provisioned-stack1", "rvm-provisioned-stack2"]]
+    assert outcomes == {
+        ("templates/stack1.template", "123456789012"): False,
+        ("templates/stack2.template", "123456789012"): False,
+    }
+    # Change sets that are never executed are deleted
+    for stack_name in ("rvm-provisioned-stack1", "rvm-provisioned-stack2"):
+        change_sets = cloudformation.list_change_sets(StackName=stack_name)
+        assert change_sets["Summaries"] == []
+
+
+class _DeletingStack:
+    """Stands in for a CloudFormation client while a stack deletes."""
+
+    def __init__(self, statuses):
+        self.statuses = list(statuses)
+
+    def describe_stacks(self, StackName):
+        status = self.statuses.pop(0)
+        if status is None:
+            raise ClientError(
+                {"Error": {"Code": "ValidationError", "Message": "does not exist"}},
+                "DescribeStacks",
+            )
+        return {"Stacks": [{"StackName": StackName, "StackStatus": status}]}
+
+
+def test_wait_delete_backs_off_until_gone(handler, monkeypatch):
+    from rvm import rvm
+
+    sleeps = []
+    monkeypatch.setattr(rvm.time, "sleep", sleeps.append)
+
+    cloudformation = _DeletingStack(["DELETE_IN_PROGRESS"] * 5 + [None])
+    rvm._wait_delete_fast(cloudformation, "rvm-provisioned-stack1")
+
+    assert sleeps == [2, 4, 8, 15, 15]
+    assert cloudformation.statuses == []
+
+
+def test_wait_delete_complete(handler, monkeypatch):
+    from rvm import rvm
+
+    monkeypatch.setattr(rvm.time, "sleep", lambda delay: None)
+
+    cloudformation = _DeletingStack(["DELETE_IN_PROGRESS", "DELETE_COMPLETE"])
+    rvm._wait_delete_fast(cloudformation, "rvm-provisioned-stack1")
+
+    assert cloudformation.statuses == []
+
+
+def test_wait_delete_failed(handler, monkeypatch):
+    from rvm import rvm
+
+    monkeypatch.setattr(rvm.time, "sleep", lambda delay: None)
+
+    with pytest.raises(RuntimeError):
+        rvm._wait_delete_fast(
+            _DeletingStack(["DELETE_IN_PROGRESS", "DELETE_FAILED"]),
+            "rvm-provisioned-stack1",
+        )
+
+
+def test_wait_delete_timeout(handler, monkeypatch):
+    from rvm import rvm
+
+    monkeypatch.setattr(rvm.time, "sleep", lambda delay: None)
+
+    with pytest.raises(TimeoutError):
+        rvm._wait_delete_fast(
+            _DeletingStack(["DELETE_IN_PROGRESS"]), "rvm-provisioned-stack1", timeout=0
+        )
+
+
+@moto.mock_aws
+def test_wait_for_deletions(handler):
+    from rvm import rvm
+
+    templates = {
+        "templates/stack1.template": TEMPLATE1_YAML,
+        "templates/stack2.template": TEMPLATE2_YAML,
+    }
+    _upload_configuration(
+        {
+            "templates": [
+                {
+                    "template_file": "templates/stack1.template",
+                    "accounts": ["222222222222"],
+                },
+                {
+                    "template_file": "templates/stack2.template",
+                    "accounts": ["222222222222"],
+                },
+            ]
+        },
+        templates,
+    )
+    assert handler(EVENT, None)["statusCode"] == 200
+
+    results = rvm.deploy_all(
+        {
+            "templates": [
+                {
+                    "template_file": "templates/stack1.template",
+                    "accounts": ["222222222222"],
+                },
+            ]
+        },
+        templates,
+        wait_for_deletions=True,
+    )
+
+    assert results["success"] == ["templates/stack1.template:222222222222"]
+    assert results["deleted"] == ["rvm-provisioned-stack2:222222222222"]
+
+
+@moto.mock_aws
+def test_assumed_sessions_are_reused_until_near_expiry(handler):
+    from rvm import rvm
+
+    session = rvm._assume_role("222222222222")
+    assert rvm._assume_role("222222222222") is session
+
+    # Credentials that would expire before the Lambda timeout are renewed
+    role_arn = "arn:aws:iam::222222222222:role/RvmWorkflowRole"
+    expiring = datetime.now(timezone.utc) + rvm.SESSION_REUSE_MARGIN / 2
+    rvm._assumed_sessions[role_arn] = (session, expiring)
+
+    renewed = rvm._assume_role("222222222222")
+    assert renewed is not session
+    assert rvm._assume_role("222222222222") is renewed